@@ -1,5 +1,49 @@
 import socket
-from struct import pack, unpack
+import os
+import time
+import hmac
+import hashlib
+import json
+import tempfile
+from struct import pack, unpack, calcsize
+
+STREAM_HEADER = "!HI"													# Stream ID and stream sequence number
+STREAM_HEADER_SIZE = calcsize(STREAM_HEADER)
+
+SYN_TIMEOUT = 0.5														# First timeout for the SYN packet, doubled on every retry
+MAX_SYN_TIMEOUT = 8														# Upper bound for the SYN timeout
+SYN_RETRIES = 6															# Number of SYN packets sent before giving up
+TOKEN_LIFETIME = 3600													# Seconds a resumption token is valid
+TOKEN_CACHE = os.path.expanduser("~/.drtp_tokens")						# File where the client keeps its resumption tokens
+SECRET_FILE = os.path.expanduser("~/.drtp_secret")						# File where the server keeps the key for its resumption tokens
+
+
+# Description:
+# raised by receive_packet when an established connection has been idle for longer than its idle timeout
+class ConnectionTimeout(Exception):
+    pass
+
+
+# Description:
+# reads the key for the resumption tokens of the server, and creates it the first time, so that tokens
+# stay valid when the server is restarted. The file is only readable by the user
+# Returns:
+# Returns the 16 byte key, or a random key that only lives as long as the process if the file can not be used
+def load_secret():
+    try:
+        fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(16))
+    except FileExistsError:
+        pass
+    except OSError:
+        return os.urandom(16)
+    try:
+        with open(SECRET_FILE, 'rb') as f:
+            secret = f.read()
+    except OSError:
+        return os.urandom(16)
+    return secret if len(secret) == 16 else os.urandom(16)
 
 class DRTP:
     
@@ -14,28 +58,213 @@ class DRTP:
         self.ip = ip
         self.port = port
         self.socket = socket
+        self.peer = None
+        self.pending = []
+        self.established = False
+        self.idle_timeout = None												# Seconds without packets from the peer before the connection is abandoned
+        self.last_received = time.time()
+        self.half_open = {}														# SYN-ACK, next resend time, timeout, resends left and whether data is dropped until a bare ACK arrives, for each client that has not completed the handshake
+        self.secret = os.urandom(16)											# Key for the resumption tokens issued by a server, see load_secret
+        self.resume_token = None												# Set while the client waits for the server to answer its resumption token
+        self.resume_retry = None												# Next resend time, timeout and resends left for the resumption token
+        self.piggyback_ack = False												# Sets the ACK flag on the first window sent by the client
         self.ACK = 1 << 0
         self.SYN = 1 << 1
         self.FIN = 1 << 2
+        self.SR = 1 << 3														# Set on data packets while the sender uses selective repeat
+        self.STREAM = 1 << 5													# Set on data packets that start with a stream header
+        self.RESUME = 1 << 6													# Set on a SYN that carries a resumption token
+        self.RST = 1 << 7														# Sent by a server that can not handle the packets of the client
 
     # Description:
     # sends a packet using UDP sockets 'sendto' method
+    # until the server has answered, the client carries the final handshake ACK on every packet it sends
     # Arguments:
     # self: reference to the instance of the class that the method is being called on
     # packet: holds a packet
     # addr: the address we want to send the packet to
     def send_packet(self, packet, addr):
+        if self.piggyback_ack:
+            flags, = unpack("!H", packet[8:10])
+            packet = packet[:8] + pack("!H", flags | self.ACK) + packet[10:]	# Sets the ACK flag in the header
         self.socket.sendto(packet, addr)
 
+    # Description:
+    # resets the connection by sending a packet with the RST flag set, the client raises ConnectionResetError
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # reason: why the connection is reset, sent as the data of the packet
+    # addr: the address of the client
+    def reset(self, reason, addr):
+        self.send_packet(self.create_packet(0, 0, self.RST, 0, reason.encode()), addr)
+
     # Description:
     # receives a packet using UDP sockets 'recvfrom' method
+    # once a connection is established, packets from any other address than the peer are dropped,
+    # and datagrams shorter than the header are always dropped
+    # packets that were put back with push_packet are returned first
     # Arguments:
     # self: reference to the instance of the class that the method is being called on
     # Returns:
     # Returns the packet and address that was recevied so that they can be utilized later in the application code
     def receive_packet(self):
-        packet, addr = self.socket.recvfrom(1472)
-        return packet, addr
+        if self.pending:
+            return self.pending.pop(0)
+        while True:
+            try:
+                packet, addr = self.socket.recvfrom(1472)
+            except socket.timeout:
+                self.check_idle()
+                self.resend_resume()
+                raise
+            if len(packet) < 12:												# Drops datagrams that are too short to hold a header
+                continue
+            if self.peer is not None and addr != self.peer:						# Only accepts packets from the connected client
+                _, _, flags, _, data = self.parse_packet(packet)
+                if flags & self.SYN:											# The client completes the handshake when the server is free
+                    self.answer_syn(packet, addr, gated=bool(flags & self.RESUME) and not self.valid_token(data, addr))
+                self.check_idle()												# Packets from other clients do not keep the connection alive
+                continue
+            self.last_received = time.time()
+            if self.established and self.handshake_packet(packet):				# Handshake packets are handled here after setup
+                continue
+            return packet, addr
+
+    # Description:
+    # raises ConnectionTimeout if the connection has an idle timeout and nothing has been received from the peer for longer
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    def check_idle(self):
+        if self.established and self.idle_timeout is not None and time.time() - self.last_received > self.idle_timeout:
+            raise ConnectionTimeout(f"nothing received from {self.peer} for {self.idle_timeout} s")
+
+    # Description:
+    # resends the resumption token with exponential backoff while the server has not answered it,
+    # called when a receive times out so that the token is only resent when it may have been lost
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    def resend_resume(self):
+        if self.resume_token is None or time.time() < self.resume_retry[0]:
+            return
+        resend_time, timeout, retries = self.resume_retry
+        if retries == 0:
+            raise ConnectionTimeout(f"no answer from {self.ip}:{self.port} to the resumption token")
+        print(f"\nNo answer to the resumption token, resending it (timeout {timeout:.1f} s)")
+        self.send_resume()
+        timeout = min(timeout * 2, MAX_SYN_TIMEOUT)
+        self.resume_retry = [time.time() + timeout, timeout, retries - 1]
+
+    # Description:
+    # sends the resumption token to the server in a SYN packet with the RESUME flag set
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    def send_resume(self):
+        resume_packet = self.create_packet(0, 0, self.SYN | self.RESUME, 0, self.resume_token)
+        self.socket.sendto(resume_packet, (self.ip, self.port))
+
+    # Description:
+    # handles a handshake packet that arrives after the connection is established, so that the reliability
+    # functions never see it. A SYN-ACK gives the client a new resumption token and is answered with a new ACK,
+    # since the server resends it when the first ACK was lost. A repeated SYN or resumption packet is dropped
+    # by the server. Any answer from the server ends the resumption and an ACK from the server ends the
+    # piggybacked handshake ACK. A reset from the server raises ConnectionResetError with the reason it sent.
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # packet: holds a packet
+    # Returns:
+    # Returns True if the packet was a handshake packet
+    def handshake_packet(self, packet):
+        seq_num, ack_num, flags, window, data = self.parse_packet(packet)
+        if flags & self.RST:
+            raise ConnectionResetError(data.decode(errors='replace'))
+        self.resume_token = None
+        if flags & 0x10:
+            self.piggyback_ack = False
+        if not flags & self.SYN:
+            return False
+        if flags & self.ACK:
+            if data:
+                self.save_token(data)
+            ack_packet = self.create_packet(seq_num+1, ack_num, self.ACK, window, b'')
+            self.send_packet(ack_packet, (self.ip, self.port))					# Answers the resent SYN-ACK
+        return True
+
+    # Description:
+    # creates a resumption token for a client, which lets the client skip the handshake the next time it connects
+    # the token holds its expiry time and an HMAC of the client IP address and the expiry time
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # addr: the address of the client
+    # Returns:
+    # Returns the token as a byte string
+    def create_token(self, addr):
+        expiry = pack("!I", int(time.time()) + TOKEN_LIFETIME)
+        mac = hmac.new(self.secret, addr[0].encode() + expiry, hashlib.sha256).digest()[:16]
+        return expiry + mac
+
+    # Description:
+    # checks that a resumption token was created by this server for the clients IP address and has not expired
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # token: the token received from the client
+    # addr: the address of the client
+    # Returns:
+    # Returns True if the token is valid
+    def valid_token(self, token, addr):
+        if len(token) != 20:
+            return False
+        expiry, = unpack("!I", token[:4])
+        mac = hmac.new(self.secret, addr[0].encode() + token[:4], hashlib.sha256).digest()[:16]
+        return hmac.compare_digest(mac, token[4:]) and expiry > time.time()
+
+    # Description:
+    # reads the resumption token saved for the server from the token cache
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # Returns:
+    # Returns the token as a byte string, or None if there is no token for the server
+    def load_token(self):
+        try:
+            with open(TOKEN_CACHE) as f:
+                token = json.load(f).get(f"{self.ip}:{self.port}")
+            return bytes.fromhex(token) if token else None
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    # Description:
+    # saves the resumption token received from the server in the token cache
+    # a token lets anyone with the IP address of the client skip the handshake, so the cache is only readable by
+    # the user. It is written to a new file that replaces the old one, so it is never left half written
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # token: the token received from the server
+    def save_token(self, token):
+        try:
+            with open(TOKEN_CACHE) as f:
+                tokens = json.load(f)
+        except (OSError, ValueError):
+            tokens = {}
+        tokens[f"{self.ip}:{self.port}"] = token.hex()
+        try:
+            fd, path = tempfile.mkstemp(dir=os.path.dirname(TOKEN_CACHE), prefix=".drtp_tokens_")	# Created with mode 0600
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(tokens, f)
+                os.replace(path, TOKEN_CACHE)
+            except OSError:
+                os.remove(path)
+                raise
+        except OSError:
+            pass																# The client can still connect with the full handshake
+
+    # Description:
+    # puts a packet back so that the next call to receive_packet returns it
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # packet: holds a packet
+    # addr: the address the packet was received from
+    def push_packet(self, packet, addr):
+        self.pending.append((packet, addr))
 
     # Description:
     # creates the header as a byte sting using the struct module, and adds the data at the end
@@ -67,49 +296,164 @@ class DRTP:
         seq_num, ack_num, flags, window = unpack("!IIHH", header)
         return seq_num, ack_num, flags, window, data if data else b''
 
+    # Description:
+    # creates a data packet for one of the streams of a multiplexed connection
+    # the stream header is placed first in the data, and the STREAM flag is set
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # seq_num: sequence number for the packet in the connection
+    # ack_num: acknowledgement number for the packet
+    # flags: specifies what type of packet is being sent
+    # window: the packets window size
+    # stream_id: the stream the data belongs to
+    # stream_seq: sequence number for the packet within the stream
+    # data: the actual data payload of the packet, an empty payload ends the stream
+    # Returns:
+    # Returns a packet that consists of a header, the stream header and the data
+    def create_stream_packet(self, seq_num, ack_num, flags, window, stream_id, stream_seq, data):
+        stream_header = pack(STREAM_HEADER, stream_id, stream_seq)
+        return self.create_packet(seq_num, ack_num, flags | self.STREAM, window, stream_header + data)
+
+    # Description:
+    # parses the stream header at the start of the data of a packet with the STREAM flag set
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # data: the data returned by parse_packet
+    # Returns:
+    # Returns the stream ID, the stream sequence number and the payload
+    def parse_stream_data(self, data):
+        stream_id, stream_seq = unpack(STREAM_HEADER, data[:STREAM_HEADER_SIZE])
+        return stream_id, stream_seq, data[STREAM_HEADER_SIZE:]
+
     # Description:
     # Establishes a connection between the server and a client using the SYN/SYN-ACK handshake,
     # a part of the TCP three-way handshake process
+    # The SYN-ACK carries a resumption token, and a client with a valid token is accepted without a handshake.
+    # A client with an invalid token gets a SYN-ACK instead, and its data is dropped until it has answered with an ACK.
+    # If the final ACK is lost, the first data packet from the client carries the ACK instead and is kept
+    # for the reliability function. The address that completes the handshake is stored as the peer of the connection
+    # Several clients can be half-open at once, and the ones that are not served now are kept for the next call
+    # The SYN-ACK is resent with exponential backoff until the client answers, so a lost ACK can not stall a
+    # transfer where the server sends first
     # Arguments:
     # self: reference to the instance of the class that the method is being called on
     def syn_server(self):
+        self.peer = None														# Accepts a SYN from any client
+        self.pending = []
+        self.established = False
         while True:
-            packet, addr = self.receive_packet()								# Receives a packet from the server
-            seq_num, ack_num, flags, window, _ = self.parse_packet(packet)		# Parses the received packet
+            self.socket.settimeout(SYN_TIMEOUT if self.half_open else None)	# Only wakes up to resend SYN-ACKs
+            try:
+                packet, addr = self.receive_packet()							# Receives a packet from the server
+            except socket.timeout:
+                self.resend_syn_acks()
+                continue
+            self.resend_syn_acks()
+            seq_num, ack_num, flags, window, data = self.parse_packet(packet)	# Parses the received packet
+            if flags & self.RESUME:												# Checks if the client resumes a session
+                if self.valid_token(data, addr):
+                    print(f"\nResumed session with {addr} using a valid token")
+                    self.peer = addr
+                    break
+                print("\nInvalid resumption token, falling back to the handshake")
             if flags & self.SYN:												# Checks if SYN flag is set
-                print("\nReceived SYN packet from the client")
-                syn_ack_packet = self.create_packet(seq_num+1, ack_num+1, self.SYN | self.ACK, window, b'')		# Creats ACK packet for the SYN packet
-                self.send_packet(syn_ack_packet, addr)							# Sends ack for the syn packet
-                print(f"SYN-ACK packet sent to {addr}")
-            if flags & self.ACK:
-                print(f"Received SYN-ACK-ACK.")
+                self.answer_syn(packet, addr, gated=bool(flags & self.RESUME))
+            elif flags & self.ACK and addr in self.half_open:					# Only a client that sent a SYN can complete the handshake
+                if self.half_open[addr][4] and (flags != self.ACK or data):		# Data sent before the client knew its token was rejected
+                    continue
+                del self.half_open[addr]
+                self.peer = addr
+                if flags != self.ACK or data:									# The ACK was piggybacked on a data packet
+                    print("Received data packet with piggybacked SYN-ACK-ACK.")
+                    self.push_packet(packet, addr)
+                else:
+                    print(f"Received SYN-ACK-ACK.")
                 break
+        self.established = True
+        self.last_received = time.time()
 
 
+    # Description:
+    # answers a SYN packet with a SYN-ACK and keeps the client as half-open until its ACK arrives
+    # this is also done for SYN packets that arrive while the server is busy with another client
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # packet: holds the SYN packet
+    # addr: the address of the client
+    # gated: drops data from the client until it has answered the SYN-ACK, used when its resumption token was rejected
+    def answer_syn(self, packet, addr, gated=False):
+        seq_num, ack_num, _, window, _ = self.parse_packet(packet)
+        print("\nReceived SYN packet from the client")
+        token = self.create_token(addr)											# Token for resuming the session later
+        syn_ack_packet = self.create_packet(seq_num+1, ack_num+1, self.SYN | self.ACK, window, token)		# Creats ACK packet for the SYN packet
+        self.half_open[addr] = [syn_ack_packet, time.time() + SYN_TIMEOUT, SYN_TIMEOUT, SYN_RETRIES, gated]
+        self.send_packet(syn_ack_packet, addr)									# Sends ack for the syn packet
+        print(f"SYN-ACK packet sent to {addr}")
+
+    # Description:
+    # resends the SYN-ACK to every half-open client whose timeout has run out, doubling its timeout each time
+    # a client that has not answered after SYN_RETRIES resends is given up
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    def resend_syn_acks(self):
+        now = time.time()
+        for addr, entry in list(self.half_open.items()):
+            syn_ack_packet, resend_time, timeout, retries, gated = entry
+            if resend_time > now:
+                continue
+            if retries == 0:
+                print(f"\nNo ACK from {addr}, giving up the handshake")
+                del self.half_open[addr]
+                continue
+            self.send_packet(syn_ack_packet, addr)
+            timeout = min(timeout * 2, MAX_SYN_TIMEOUT)
+            self.half_open[addr] = [syn_ack_packet, now + timeout, timeout, retries - 1, gated]
+
     # Description:
     # Initiates a three way handshake with the server by sending a SYN packet to the server.
-    # Waits for acknowledgement from server, and retransmits the packet if ACK is not received
+    # Waits for acknowledgement from server, and retransmits the packet with exponential backoff if ACK is not received
+    # With a saved resumption token for the server, the token is sent once and data can be sent at once.
+    # The token is resent by receive_packet when a receive times out before the server has answered
     # Arguments:
     # self: reference to the instance of the class that the method is being called on
+    # Returns:
+    # Returns True when the connection is established, and False if the server did not answer any of the SYN packets
     def syn_client(self):
+        token = self.load_token()
+        if token is not None:
+            print("Resuming session with saved token, skipping the handshake.")
+            self.resume_token = token
+            self.resume_retry = [time.time() + SYN_TIMEOUT, SYN_TIMEOUT, SYN_RETRIES - 1]
+            self.send_resume()
+            self.established = True
+            return True
+
         syn_seq_num = 0  														# Sequence number for the first SYN packet
         syn_packet = self.create_packet(syn_seq_num, 0, self.SYN, 64, b'')		# Creates the SYN packet
-        self.send_packet(syn_packet, (self.ip, self.port))						# Sends the packet to the server address
-
-        self.socket.settimeout(0.5)												# Setting a timeout of 50ms
+        timeout = SYN_TIMEOUT
 
-        while True:
+        for attempt in range(SYN_RETRIES):
+            self.send_packet(syn_packet, (self.ip, self.port))					# Sends the packet to the server address
+            deadline = time.time() + timeout
             try:
-                packet, addr = self.receive_packet()							# Receiving packet from server
-                seq_num, ack_num, flags, window, _ = self.parse_packet(packet)	# Parsing the packet
-                if flags & self.SYN and flags & self.ACK and ack_num == syn_seq_num + 1:	# Checking if the packet is an ACK for the SYN packet
-                    print("Received SYN-ACK packet from the server. Seding SYN-ACK-ACK")
-                    ack_packet = self.create_packet(seq_num+1, ack_num, self.ACK, window, b'') 	# Create new ACK packet for the SYN-ACK packet
-                    self.send_packet(ack_packet, (self.ip, self.port))			# Sending ACK back to the server upon receiving SYN-ACK
-                    break
+                while True:
+                    self.socket.settimeout(max(deadline - time.time(), 0.001))	# Waits until the deadline for this attempt
+                    packet, addr = self.receive_packet()						# Receiving packet from server
+                    seq_num, ack_num, flags, window, data = self.parse_packet(packet)	# Parsing the packet
+                    if flags & self.SYN and flags & self.ACK and ack_num == syn_seq_num + 1:	# Checking if the packet is an ACK for the SYN packet
+                        print("Received SYN-ACK packet from the server. Seding SYN-ACK-ACK")
+                        if data:
+                            self.save_token(data)								# Saves the token for resuming later
+                        ack_packet = self.create_packet(seq_num+1, ack_num, self.ACK, window, b'') 	# Create new ACK packet for the SYN-ACK packet
+                        self.send_packet(ack_packet, (self.ip, self.port))		# Sending ACK back to the server upon receiving SYN-ACK
+                        self.piggyback_ack = True								# The first window also carries the ACK in case it is lost
+                        self.established = True
+                        return True
             except socket.timeout:
-                print("\nTimeout occurred, resending SYN packet")
-                self.send_packet(syn_packet, (self.ip, self.port))				# Resend the SYN packet if the timeout occurs
+                timeout = min(timeout * 2, MAX_SYN_TIMEOUT)						# Doubles the timeout for the next attempt
+                if attempt < SYN_RETRIES - 1:
+                    print(f"\nTimeout occurred, resending SYN packet (timeout {timeout:.1f} s)")
+        return False
 
     # Description:
     # Closes the connection using UDP sockets close method
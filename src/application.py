@@ -2,44 +2,279 @@ import argparse
 from DRTP import *
 import time
 import os
+import multiprocessing
+import queue
+import tempfile
+from delta import *
 
 import sys
 
+try:
+    import fcntl  # Used to lock the files of delta transfers
+except ImportError:
+    fcntl = None
+
+IDLE_TIMEOUT = 10  # Seconds a worker waits for a silent client before it abandons the transfer
+MIN_WORKER_UPTIME = 1  # A worker that exits sooner after it was started is not restarted
+
 
 # Description:
 # creates a server socket using UDP and utilizes DRTP for reliable data transfer
 # establishes a connection with the client before selecting and running a specified reliability function
+# with more than one worker, the connections are spread over several worker processes instead
 # Arguments:
 # ip: holds the ip address for the server
 # port: port number of the server
 # file_name: holds the filename for the received file
 # reliablility_func: reliability function to use for sending data
 # test_case: test case to test the reliability functions
+# workers: number of worker processes sharing the server port
+# delta: receives a delta against the existing file instead of the whole file
+# window_size: size of the sliding window used to send the block signatures of a delta transfer
 # Returns:
 # No returns, only prints message that the server is listening
-def server(ip, port, file_name, reliability_func, test_case):
+def server(ip, port, file_name, reliability_func, test_case, workers=1, delta=False, window_size=5):
+    if workers > 1:
+        supervise_workers(ip, port, file_name, reliability_func, test_case, workers, delta, window_size)
+        return
+
+    server_socket = create_server_socket(port)
+    server_drtp = DRTP(ip, port, server_socket)
+    server_drtp.secret = load_secret()
+
+    print("-----------------------------------------------")
+    print("A server is listening on port", port)
+    print("-----------------------------------------------")
+
+    server_drtp.syn_server()
+    try:
+        if delta:
+            delta_server(server_drtp, file_name, reliability_func, window_size, test_case)
+        else:
+            run_server_func(server_drtp, file_name, reliability_func, test_case)
+    except ConnectionResetError as e:
+        print(f"\nConnection reset: {e}")
+
+
+# Description:
+# creates and binds the UDP socket used by the server
+# Arguments:
+# port: port number of the server
+# reuse_port: sets SO_REUSEPORT so that several worker processes can bind the same port
+# Returns:
+# Returns the bound socket
+def create_server_socket(port, reuse_port=False):
     try:
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     except socket.error as e:
         print(f"Error creating socket: {e}")
+        sys.exit(1)
     try:
         server_socket.bind(('', port))
     except socket.error as e:
         print(f"Error binding socket: {e}")
+        sys.exit(1)
+    return server_socket
+
+
+# Description:
+# runs the server side of the specified reliability function for one connection
+# Arguments:
+# drtp: an instance of the reliable transport protocol with an established connection
+# file_name: holds the filename for the received file
+# reliablility_func: reliability function to use for receiving data
+# test_case: test case to test the reliability functions
+def run_server_func(drtp, file_name, reliability_func, test_case):
+    if reliability_func == "stop-and-wait":
+        stop_and_wait_server(drtp, file_name, test_case)
+    elif reliability_func == "gbn":
+        gbn_server(drtp, file_name, test_case)
+    elif reliability_func == "sr":
+        sr_server(drtp, file_name, test_case)
+    elif reliability_func == "auto":
+        auto_server(drtp, file_name, test_case)
+    elif reliability_func == "mux":
+        mux_server(drtp, file_name, test_case)
+
+
+# Description:
+# builds a file name for a connection so that concurrent clients do not overwrite each others files
+# Arguments:
+# file_name: holds the filename given to the server
+# addr: the address of the client
+# with_port: adds the client port, which changes for every connection; without it the name is the same every
+# time a host connects, which the delta transfer needs to find its earlier copy of the file
+# Returns:
+# Returns the file name with the client address added before the extension, e.g. received_10.0.0.1_40000.jpg
+def connection_file_name(file_name, addr, with_port=True):
+    root, ext = os.path.splitext(file_name)
+    if with_port:
+        return f"{root}_{addr[0]}_{addr[1]}{ext}"
+    return f"{root}_{addr[0]}{ext}"
+
+
+# Description:
+# runs in a worker process: serves one connection after another on its socket, which is bound to the shared port
+# with SO_REUSEPORT. The kernel hashes each client to one of the sockets, so every worker runs the normal
+# handshake and reliability function for the clients it is given
+# a transfer where the client stays silent for IDLE_TIMEOUT seconds (a dead client or a lost FIN) is abandoned,
+# so that the worker can serve the next client, and so is a transfer that fails with any other error
+# Arguments:
+# worker_id: number of the worker, used in the statistics
+# server_socket: the socket of the worker, created by the supervisor
+# ip: holds the ip address for the server
+# port: port number of the server
+# file_name: holds the filename for the received files
+# reliablility_func: reliability function to use for receiving data
+# test_case: test case to test the reliability functions
+# delta: receives a delta against the existing file instead of the whole file
+# window_size: size of the sliding window used to send the block signatures of a delta transfer
+# secret: key for the resumption tokens, shared by all workers so that any worker accepts a token
+# stats: queue used to report each finished transfer to the supervisor
+def server_worker(worker_id, server_socket, ip, port, file_name, reliability_func, test_case, delta, window_size,
+                  secret, stats):
     server_drtp = DRTP(ip, port, server_socket)
+    server_drtp.secret = secret
+    server_drtp.idle_timeout = IDLE_TIMEOUT
+
+    try:
+        while True:
+            server_socket.settimeout(None)  # Waits for the next client without timing out
+            server_drtp.syn_server()
+            client_addr = server_drtp.peer
+            conn_file = connection_file_name(file_name, client_addr, with_port=not delta)
+
+            start_time = time.time()
+            try:
+                if delta:
+                    delta_server(server_drtp, conn_file, reliability_func, window_size, test_case)
+                else:
+                    run_server_func(server_drtp, conn_file, reliability_func, test_case)
+            except (ConnectionTimeout, ConnectionResetError) as e:
+                print(f"\nWorker {worker_id}: {e}. Abandoning the transfer.")
+                continue
+            except Exception as e:  # Keeps the worker serving other clients after an unexpected error
+                print(f"\nWorker {worker_id}: error during the transfer: {e!r}. Abandoning the transfer.")
+                continue
+            end_time = time.time()
+
+            # Reports the transfer to the supervisor
+            stats.put((worker_id, client_addr, os.path.getsize(conn_file), start_time, end_time))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server_drtp.close()
+
+
+# Description:
+# starts the worker processes and aggregates the statistics they report until the server is interrupted
+# the sockets are bound here, so that a port that can not be bound stops the server before it starts listening,
+# and a worker that dies is restarted on the same socket. Packets for it wait in the socket meanwhile
+# Arguments:
+# ip: holds the ip address for the server
+# port: port number of the server
+# file_name: holds the filename for the received files
+# reliablility_func: reliability function to use for receiving data
+# test_case: test case to test the reliability functions
+# workers: number of worker processes to start
+# delta: receives a delta against the existing file instead of the whole file
+# window_size: size of the sliding window used to send the block signatures of a delta transfer
+def supervise_workers(ip, port, file_name, reliability_func, test_case, workers, delta, window_size):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("SO_REUSEPORT is not supported on this platform: run the server with a single worker!")
+        sys.exit(1)
+
+    stats = multiprocessing.Queue()
+    secret = load_secret()  # The same token key for every worker
+    sockets = [create_server_socket(port, reuse_port=True) for _ in range(workers)]
+    processes = []
+    start_times = []
+
+    # Starts the worker with the given ID on its socket
+    def start_worker(worker_id):
+        process = multiprocessing.Process(target=server_worker,
+                                          args=(worker_id, sockets[worker_id], ip, port, file_name,
+                                                reliability_func, test_case, delta, window_size, secret, stats))
+        process.start()
+        return process, time.time()
+
+    for worker_id in range(workers):
+        process, start_time = start_worker(worker_id)
+        processes.append(process)
+        start_times.append(start_time)
 
     print("-----------------------------------------------")
-    print("A server is listening on port", port)
+    print(f"A server is listening on port {port} with {workers} workers")
     print("-----------------------------------------------")
 
-    server_drtp.syn_server()
+    # Variables for the aggregated statistics
+    connections = 0
+    total_bytes = 0
+    intervals = []  # Start and end time of every transfer
 
-    if reliability_func == "stop-and-wait":
-        stop_and_wait_server(server_drtp, file_name, test_case)
-    elif reliability_func == "gbn":
-        gbn_server(server_drtp, file_name, test_case)
-    elif reliability_func == "sr":
-        sr_server(server_drtp, file_name, test_case)
+    try:
+        while True:
+            # Restarts the workers that have died, unless a worker dies as soon as it is started
+            for worker_id, process in enumerate(processes):
+                if process.is_alive():
+                    continue
+                if time.time() - start_times[worker_id] < MIN_WORKER_UPTIME:
+                    print(f"\nWorker {worker_id} exited with code {process.exitcode} right after starting!")
+                    sys.exit(1)
+                print(f"\nWorker {worker_id} exited with code {process.exitcode}, restarting it.")
+                processes[worker_id], start_times[worker_id] = start_worker(worker_id)
+
+            try:
+                worker_id, addr, size, start_time, end_time = stats.get(timeout=1)
+            except queue.Empty:
+                continue
+            connections += 1
+            total_bytes += size
+            intervals.append((start_time, end_time))
+
+            # Printing the statistics for the connection and for all connections so far
+            elapsed_time = end_time - start_time
+            file_size = (size * 8) / 1000000
+            print(f"\nWorker {worker_id}: received {file_size:.2f} Mb from {addr[0]}:{addr[1]} in {elapsed_time:.2f} s")
+
+            # The aggregate throughput only counts the time where at least one worker was receiving
+            total_size = (total_bytes * 8) / 1000000
+            total_time = busy_time(intervals)
+            throughput = total_size / total_time if total_time > 0 else 0
+            print(f"Connections: {connections}, Transferred data: {total_size:.2f} Mb, "
+                  f"Busy time: {total_time:.2f} s, Aggregate throughput: {throughput:.2f} Mbps")
+    except KeyboardInterrupt:
+        print("\nStopping workers.")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        for server_socket in sockets:
+            server_socket.close()
+
+
+# Description:
+# finds the time covered by at least one of the intervals, so that idle time between transfers is not counted
+# and transfers that run at the same time on different workers are only counted once
+# Arguments:
+# intervals: a list of (start time, end time) tuples
+# Returns:
+# Returns the busy time in seconds
+def busy_time(intervals):
+    total = 0
+    busy_start, busy_end = None, None
+    for start, end in sorted(intervals):
+        if busy_end is None or start > busy_end:
+            if busy_end is not None:
+                total += busy_end - busy_start
+            busy_start, busy_end = start, end
+        else:
+            busy_end = max(busy_end, end)
+    if busy_end is not None:
+        total += busy_end - busy_start
+    return total
 
 
 # Description:
@@ -51,40 +286,78 @@ def server(ip, port, file_name, reliability_func, test_case):
 # port: port number of the server
 # file_name: holds the filename for the received file
 # reliablility_func: reliability function to use for sending data 
-# window_size: specifies a size for the sliding window in the gbn and sr functions
+# window_size: specifies a size for the sliding window in the gbn, sr and auto functions
 # test_case: test case to test the reliability functions
+# delta: sends only the parts of the file that the server does not already have
+# streams: extra (file path, weight) streams sent next to file_name by the mux function
 # Returns: 
 # No returns, only prints the throughput of the file transfer
-def client(ip, port, file_name, reliability_func, window_size, test_case):
+def client(ip, port, file_name, reliability_func, window_size, test_case, delta=False, streams=()):
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     client_drtp = DRTP(ip, port, client_socket)
     print("\nSending SYN from the client. Waiting for SYN-ACK.")
-    client_drtp.syn_client()
+
+    if not client_drtp.syn_client():
+        print("\nNo SYN-ACK received: could not connect to the server!")
+        client_drtp.close()
+        sys.exit(1)
 
     start_time = time.time()
 
-    if reliability_func == "stop-and-wait":
-        stop_and_wait_client(client_drtp, file_name, test_case)
-    elif reliability_func == "gbn":
-        gbn_client(client_drtp, file_name, window_size, test_case)
-    elif reliability_func == "sr":
-        sr_client(client_drtp, file_name, window_size, test_case)
+    try:
+        if delta:
+            sent_bytes = delta_client(client_drtp, file_name, reliability_func, window_size, test_case)
+        else:
+            run_client_func(client_drtp, file_name, reliability_func, window_size, test_case, streams)
+    except ConnectionResetError as e:
+        print(f"\nConnection reset by the server: {e}!")
+        client_drtp.close()
+        sys.exit(1)
+    except ConnectionTimeout as e:
+        print(f"\nCould not connect to the server: {e}!")
+        client_drtp.close()
+        sys.exit(1)
 
     end_time = time.time()
     elapsed_time = end_time - start_time  # Finds the elapsed time
 
-    file_size = (os.path.getsize(file_name) * 8) / 1000000  # Finds the size of the file in Mb
+    total_size = os.path.getsize(file_name) + sum(os.path.getsize(path) for path, _ in streams)
+    file_size = (total_size * 8) / 1000000  # Finds the size of the files in Mb
     throughput = file_size / elapsed_time
 
     # Printing the statistics
     print(f"\nElapsed Time: {elapsed_time:.2f} s")
     print(f"Transferred data: {(file_size):.2f} Mb")
+    if delta:
+        print(f"Delta sent: {(sent_bytes * 8) / 1000000:.2f} Mb")
     print(f"Throughput: {throughput:.2f} Mbps")
 
     print("\nFIN-ACK received. Closing connection.")
     client_drtp.close()  # Closing the connection upon receiving FIN
 
 
+# Description:
+# runs the client side of the specified reliability function
+# Arguments:
+# drtp: an instance of the reliable transport protocol with an established connection
+# file_name: holds the filename for the file to send
+# reliablility_func: reliability function to use for sending data
+# window_size: specifies a size for the sliding window in the gbn, sr and auto functions
+# test_case: test case to test the reliability functions
+# streams: extra (file path, weight) streams sent next to file_name by the mux function
+def run_client_func(drtp, file_name, reliability_func, window_size, test_case, streams=()):
+    if reliability_func == "stop-and-wait":
+        stop_and_wait_client(drtp, file_name, test_case)
+    elif reliability_func == "gbn":
+        gbn_client(drtp, file_name, window_size, test_case)
+    elif reliability_func == "sr":
+        sr_client(drtp, file_name, window_size, test_case)
+    elif reliability_func == "auto":
+        auto_client(drtp, file_name, window_size, test_case)
+    elif reliability_func == "mux":
+        mux_client(drtp, [(file_name, 1)] + list(streams), window_size, test_case)
+
+
 # Helper function for error handling related to file
 def open_file(file_path, mode):
     try:
@@ -97,6 +370,141 @@ def open_file(file_path, mode):
         sys.exit(1)
 
 
+# Description:
+# Implements the server side of a delta transfer: sends block signatures of the existing file to the client and
+# receives the delta, both with the specified reliability function, and rebuilds the file from the old copy and the delta
+# The existing file is opened once, so the delta is applied to the data the signatures were computed from even if
+# the file is replaced meanwhile, and a second delta transfer to the same file at the same time is reset
+# Arguments:
+# drtp: an instance of the reliable transport protocol with an established connection
+# file: the file path of the existing file, which is replaced by the received file
+# reliablility_func: reliability function to use for sending the signatures and receiving the delta
+# window_size: specifies a size for the sliding window used to send the signatures
+# test_case: test case to test the reliability functions
+def delta_server(drtp, file, reliability_func, window_size, test_case):
+    lock = lock_file(file)
+    if lock is None:
+        reason = "another delta transfer to the same file is in progress"
+        drtp.reset(reason, drtp.peer)
+        raise ConnectionResetError(f"{reason}: {file}")
+
+    basis = open_basis(file)
+    sig_path = temp_file_name()
+    delta_path = temp_file_name()
+    rebuilt_path = temp_file_name(os.path.dirname(os.path.abspath(file)))  # On the same file system, for os.replace
+
+    try:
+        blocks = write_signatures(basis, sig_path)
+        print(f"\nDelta transfer: sending signatures of {blocks} blocks from {file}.")
+
+        # Sends the signatures back to the client with the sending side of the reliability function, on the same
+        # connection so that clients that connect meanwhile are kept as half-open; the sending functions send to
+        # drtp.ip and drtp.port, so they point to the client until the signatures are sent
+        server_addr = (drtp.ip, drtp.port)
+        drtp.ip, drtp.port = drtp.peer
+        try:
+            run_client_func(drtp, sig_path, reliability_func, window_size, None)
+            fin_seq = -(-os.path.getsize(sig_path) // 1460)  # The FIN follows the last 1460 byte data packet
+            wait_for_delta(drtp, fin_seq)  # Puts the first delta packet back for the receiving function
+        finally:
+            drtp.ip, drtp.port = server_addr
+
+        run_server_func(drtp, delta_path, reliability_func, test_case)
+
+        print("\nRebuilding file from the existing file and the received delta.")
+        apply_delta(basis, delta_path, rebuilt_path)
+        os.replace(rebuilt_path, file)
+    finally:
+        if basis is not None:
+            basis.close()
+        lock.close()
+        for path in (sig_path, delta_path, rebuilt_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Description:
+# locks the file of a delta transfer, using a lock file next to it that is left in place for later transfers
+# the lock is held across worker processes and released when the returned file is closed or the process dies
+# without fcntl the file is not locked, and concurrent transfers are still applied to their own copy of the file
+# Arguments:
+# file: the file path of the existing file
+# Returns:
+# Returns the open lock file, or None if another transfer holds the lock
+def lock_file(file):
+    lock = open(file + ".lock", 'a')
+    if fcntl is None:
+        return lock
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+# Description:
+# Waits until the client has received the FIN of the signature transfer and starts sending the delta
+# The FIN is resent until the first packet of the delta arrives, which is put back for the receiving function
+# Arguments:
+# drtp: an instance of the reliable transport protocol used to send the signatures
+# fin_seq: the sequence number of the FIN packet
+def wait_for_delta(drtp, fin_seq):
+    fin_packet = drtp.create_packet(fin_seq, 0, drtp.FIN, 0, b'')
+    drtp.socket.settimeout(0.5)  # Setting a timeout of 500ms
+    while True:
+        try:
+            packet, addr = drtp.receive_packet()
+            _, _, flags, _, _ = drtp.parse_packet(packet)
+
+            # ACKs and the FIN-ACK from the signature transfer are skipped
+            if not flags & 0x10:
+                drtp.push_packet(packet, addr)
+                break
+        except socket.timeout:
+            print("\nTimeout occurred. Resending FIN packet.")
+            drtp.send_packet(fin_packet, (drtp.ip, drtp.port))
+
+
+# Description:
+# Implements the client side of a delta transfer: receives the block signatures of the servers existing file,
+# finds the blocks the server already has and sends only copy instructions and literal data
+# Arguments:
+# drtp: an instance of the reliable transport protocol with an established connection
+# file: the file path of the file to be sent
+# reliablility_func: reliability function to use for receiving the signatures and sending the delta
+# window_size: specifies a size for the sliding window in the gbn, sr and auto functions
+# test_case: test case to test the reliability functions
+# Returns:
+# Returns the size of the delta in bytes
+def delta_client(drtp, file, reliability_func, window_size, test_case):
+    open_file(file, 'rb').close()  # Checks that the file can be read before any signatures are received
+    sig_path = temp_file_name()
+    delta_path = temp_file_name()
+
+    try:
+        print("\nDelta transfer: receiving block signatures from the server.")
+        run_server_func(drtp, sig_path, reliability_func, None)
+
+        literal_bytes, copied_blocks = write_delta(file, read_signatures(sig_path), delta_path)
+        print(f"\nDelta: {copied_blocks} blocks copied, {literal_bytes} bytes of literal data.")
+
+        run_client_func(drtp, delta_path, reliability_func, window_size, test_case)
+        return os.path.getsize(delta_path)
+    finally:
+        for path in (sig_path, delta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Helper function that creates an empty temporary file, in the system temp directory unless another is given,
+# and returns its path
+def temp_file_name(directory=None):
+    fd, path = tempfile.mkstemp(prefix="drtp_", dir=directory)
+    os.close(fd)
+    return path
+
+
 # Description:
 # Implements a stop-and-wait server for receiving a file over a reliable transport protocol
 # Arguments:
@@ -160,6 +568,8 @@ def stop_and_wait_server(drtp, file, test_case):
 # Arguments:
 # drtp: an instance of the reliable transport protocol
 # file: the file path to the file to be sent
+# Returns:
+# Returns the sequence number of the FIN packet
 def stop_and_wait_client(drtp, file, test_case):
     print("\nStop-and-wait client started.")
 
@@ -545,6 +955,506 @@ def sr_client(drtp, file, window_size, test_case):
         drtp.send_packet(fin_packet, (drtp.ip, drtp.port))
 
 
+# Thresholds used by the adaptive reliability function
+SAMPLE_SIZE = 100       # Number of new packets and loss events between two decisions
+LOSS_WEIGHT = 0.25      # Weight of the last sample in the smoothed loss rate
+HIGH_LOSS = 0.2         # Loss rate where the client backs off to stop-and-wait, it returns below half of it
+SR_LOSS = 0.02          # Loss rate where selective repeat is preferred over Go-Back-N, it returns below half of it
+HIGH_RTT = 0.05         # RTT in seconds where a resent window costs so much that SR is preferred at half the loss rate
+GBN_LOSS_BUDGET = 0.5   # Expected number of losses per Go-Back-N window, each of which resends the whole window
+SWITCH_SAMPLES = 2      # Number of samples in a row that must agree before the reliability function is switched
+MIN_TIMEOUT = 0.01      # Lower bound for the timeout, so that spurious timeouts are not mistaken for loss
+
+
+# Description:
+# Chooses the reliability function and window size from the conditions measured so far
+# the thresholds for leaving a mode are half of those for entering it, so a loss rate close to a
+# threshold does not make the client switch back and forth
+# Arguments:
+# mode: the reliability function in use
+# loss_rate: the smoothed number of loss events per packet sent
+# avg_rtt: the average RTT in seconds
+# reordering: share of the ACKs during the last sample for packets that arrived after a later packet
+# window_size: the largest window size the user allows
+# Returns:
+# Returns the name of the reliability function and the window size to use
+def choose_mode(mode, loss_rate, avg_rtt, reordering, window_size):
+    high_loss = HIGH_LOSS / 2 if mode == "stop-and-wait" else HIGH_LOSS
+    sr_loss = SR_LOSS / 2 if avg_rtt >= HIGH_RTT else SR_LOSS
+    if mode == "sr":
+        sr_loss /= 2
+
+    if loss_rate >= high_loss:
+        return "stop-and-wait", 1
+    if reordering > 0 or loss_rate >= sr_loss:
+        return "sr", window_size
+
+    # Go-Back-N resends the whole window after a loss, so the window is kept small enough to
+    # expect at most GBN_LOSS_BUDGET losses in it
+    if loss_rate > 0:
+        return "gbn", max(2, min(window_size, int(GBN_LOSS_BUDGET / loss_rate)))
+    return "gbn", window_size
+
+
+# Description:
+# Implements an adaptive server that receives like Go-Back-N or Selective Repeat, as signalled by the client
+# Every data packet carries the SR flag while the client uses selective repeat, and then out-of-order packets
+# are buffered instead of discarded. Stop-and-wait is Go-Back-N with a window of one, so it needs no flag.
+# Every ACK carries the cumulative ACK number and echoes the sequence number that triggered it.
+# Arguments:
+# drtp: an instance of the reliable transport protocol
+# file: the file path where the received file will be saved
+# test_case: a test case to execute, such as 'skip_ack' to simulate a skipped acknowledgment
+def auto_server(drtp, file, test_case):
+    print("\nAdaptive server started.")
+
+    # Opening the file in write binary mode
+    with open_file(file, 'wb') as f:
+        expected_seq = 0
+        skip_ack_counter = 0
+        received = {}  # A dictionary to buffer out-of-order packets while in SR mode
+        sr_mode = False
+
+        print("Receiving data...\n")
+        while True:
+            try:
+                drtp.socket.settimeout(0.5)  # Setting a timeout of 500ms
+                data_packet, data_addr = drtp.receive_packet()  # Receiving packet from client
+                seq_num, _, flags, window, data = drtp.parse_packet(data_packet)  # Parsing the received packet
+
+                # Checks for FIN flag and sends FIN-ACK in response
+                if flags & drtp.FIN:
+                    print("\nFIN flag received. Sending FIN-ACK")
+                    ack_packet = drtp.create_packet(seq_num, seq_num, 0x10, 0, b'')
+                    drtp.send_packet(ack_packet, data_addr)
+                    break
+
+                # Follows the client when it switches between GBN and SR
+                if bool(flags & drtp.SR) != sr_mode:
+                    sr_mode = not sr_mode
+                    print(f"Client switched to {'SR' if sr_mode else 'GBN'} with window size {window}")
+
+                # Writes data to the file if the received sequence number matches the expected sequence number
+                if seq_num == expected_seq:
+                    f.write(data)
+                    expected_seq += 1
+
+                    # While there are in-order packets in the buffer, write them to the file
+                    while expected_seq in received:
+                        f.write(received.pop(expected_seq))
+                        expected_seq += 1
+
+                elif seq_num > expected_seq:
+                    print(f"Out-of-order packet received: {seq_num}")
+                    if sr_mode:
+                        received[seq_num] = data
+                else:
+                    print(f"Duplicate packet received: {seq_num}")
+
+                # Skips sending an ACK if the test_case is 'skip_ack' and skip_ack_counter is 0
+                if test_case == 'skip_ack' and skip_ack_counter == 0:
+                    skip_ack_counter += 1
+                    print(f"Skip ACK triggered at sequence number {seq_num} \n")
+                else:
+                    ack_flags = 0x10 | (drtp.SR if sr_mode else 0)
+                    ack_packet = drtp.create_packet(seq_num, expected_seq, ack_flags, 0, b'')
+                    drtp.send_packet(ack_packet, data_addr)
+
+            except socket.timeout:
+                print("\nTimeout occurred on the server.")
+                continue
+
+
+# Description:
+# Implements an adaptive client that switches between stop-and-wait, Go-Back-N and Selective Repeat during the
+# transfer. It measures loss events, reordering and the RTT, and after every sample chooses the reliability
+# function and window size with choose_mode. The choice is signalled to the server with the SR flag and the
+# window field of each data packet, so the connection is never restarted.
+# A timeout counts as one loss event in Go-Back-N and stop-and-wait, and as one event per packet missing below
+# the highest acknowledged packet in SR, so resending a whole window is not counted as losing it. An ACK for a
+# packet that was sent only once and arrived after a later packet counts as reordering.
+# Arguments:
+# drtp: an instance of the reliable transport protocol
+# file: the file path of the file to be sent
+# window_size: the largest window size to use
+# test_case: a test case to execute, such as 'skip_seq' to simulate skipping a packet sequence number
+def auto_client(drtp, file, window_size, test_case):
+    print("\nAdaptive client started.")
+
+    # Opening file in read binary mode
+    with open_file(file, 'rb') as f:
+        base = 0
+        next_seq_num = 0
+        packets_in_window = {}  # Data of the unacknowledged packets
+        send_times = {}  # Time each unacknowledged packet that has only been sent once was sent
+        highest_acked = -1  # Highest sequence number echoed by the server
+
+        # Starting with Go-Back-N and the full window
+        mode = "gbn"
+        window = window_size
+        timeout = 0.5
+        avg_rtt = None
+        loss_rate = None
+        next_mode = None  # Mode suggested by the previous sample
+        agreeing = 0  # Number of samples in a row that suggested next_mode
+
+        # Variables for the current sample
+        sent = 0
+        loss_events = 0
+        acks = 0
+        reordered = 0
+
+        # Variable for skip_seq test case
+        skip_seq = 4
+
+        print("Transmitting data...")
+        while True:
+            flags = drtp.SR if mode == "sr" else 0
+
+            # Reading 1460 bytes of data from the file until theres no more data
+            while next_seq_num < base + window:
+                data = f.read(1460)
+                if not data:
+                    break
+
+                packets_in_window[next_seq_num] = data
+                send_times[next_seq_num] = time.time()
+
+                # Skipping a sequence number to simulate loss
+                if test_case == "skip_seq" and next_seq_num == skip_seq:
+                    print(f"\nSkipping packet with sequence number: {next_seq_num}")
+                else:
+                    packet = drtp.create_packet(next_seq_num, 0, flags, window, data)
+                    drtp.send_packet(packet, (drtp.ip, drtp.port))
+
+                next_seq_num += 1
+                sent += 1
+
+                # Sending an old sequence number to test the handling of duplicate packets
+                if test_case == "duplicate" and next_seq_num == 6:
+                    print(f"Sending duplicate packet with sequence number: {next_seq_num - 1}")
+                    drtp.send_packet(packet, (drtp.ip, drtp.port))
+                    send_times.pop(next_seq_num - 1, None)  # Its second ACK is not a sign of reordering
+
+            if not packets_in_window:
+                break
+
+            # Receives ACK packets and updates the window accordingly
+            try:
+                drtp.socket.settimeout(timeout)
+                ack_packet, ack_addr = drtp.receive_packet()  # Receiving ACK from server
+                seq_num, ack_num, ack_flags, _, _ = drtp.parse_packet(ack_packet)
+
+                if not ack_flags & 0x10:  # Checking if the received packet is an ACK
+                    continue
+
+                # Takes an RTT sample from the first ACK of a packet that was only sent once,
+                # and sets the timeout to 4RTTs
+                send_time = send_times.pop(seq_num, None)
+                if send_time is not None:
+                    rtt = time.time() - send_time
+                    avg_rtt = rtt if avg_rtt is None else 0.875 * avg_rtt + 0.125 * rtt
+                    timeout = max(4 * avg_rtt, MIN_TIMEOUT)
+
+                # A packet sent once that arrives after a later packet was reordered, a gap left by a lost
+                # packet is only filled by a resent packet
+                acks += 1
+                if send_time is not None and seq_num < highest_acked:
+                    reordered += 1
+                highest_acked = max(highest_acked, seq_num)
+
+                # Removes every packet before the cumulative ACK number, and the echoed packet if it was buffered
+                for acked in range(base, ack_num):
+                    packets_in_window.pop(acked, None)
+                if ack_flags & drtp.SR:
+                    packets_in_window.pop(seq_num, None)
+                while base < next_seq_num and base not in packets_in_window:
+                    send_times.pop(base, None)  # Packets acknowledged by a later cumulative ACK give no RTT sample
+                    base += 1
+
+            except socket.timeout:
+                # Resends every unacknowledged packet
+                print("\nTimeout occurred.")
+                if mode == "sr":
+                    loss_events += max(1, sum(1 for seq in packets_in_window if seq < highest_acked))
+                else:
+                    loss_events += 1
+                for seq_num in sorted(packets_in_window.keys()):
+                    packet = drtp.create_packet(seq_num, 0, flags, window, packets_in_window[seq_num])
+                    drtp.send_packet(packet, (drtp.ip, drtp.port))
+                    send_times.pop(seq_num, None)  # A resent packet gives no RTT sample
+                    print(f"Resending packet with sequence number: {seq_num}")
+
+            # Chooses the reliability function and window size for the next sample
+            if sent + loss_events >= SAMPLE_SIZE:
+                sample = loss_events / max(sent, 1)
+                loss_rate = sample if loss_rate is None else (1 - LOSS_WEIGHT) * loss_rate + LOSS_WEIGHT * sample
+                reordering = reordered / max(acks, 1)
+                new_mode, new_window = choose_mode(mode, loss_rate, avg_rtt or 0, reordering, window_size)
+
+                # Switches the reliability function only after SWITCH_SAMPLES samples in a row agree,
+                # the window size follows the smoothed loss rate right away
+                if new_mode == mode:
+                    next_mode, agreeing = None, 0
+                    window = new_window
+                else:
+                    agreeing = agreeing + 1 if new_mode == next_mode else 1
+                    next_mode = new_mode
+                    if agreeing >= SWITCH_SAMPLES:
+                        print(f"\nSwitching to {new_mode} with window size {new_window} "
+                              f"(loss: {loss_rate:.1%}, RTT: {(avg_rtt or 0) * 1000:.2f} ms, "
+                              f"reordering: {reordering:.1%})")
+                        mode, window = new_mode, new_window
+                        next_mode, agreeing = None, 0
+
+                sent = loss_events = acks = reordered = 0
+
+        # Sends a packet with the FIN flag set after the file data has been sent
+        print("\nSending FIN packet.")
+        fin_packet = drtp.create_packet(next_seq_num, 0, drtp.FIN, 0, b'')
+        drtp.send_packet(fin_packet, (drtp.ip, drtp.port))
+
+
+# Description:
+# Schedules the packets of several streams that share one connection, using stride scheduling:
+# every stream has a pass value that grows by 1 / weight for each packet it sends, and the stream with
+# the lowest pass value sends next, so a stream with weight 4 sends four packets for every packet of a
+# stream with weight 1, and a small stream with a high weight finishes early next to a bulk transfer
+class StreamScheduler:
+
+    # Description:
+    # opens the files of the streams
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # streams: a list of (file path, weight) tuples, the index in the list is used as the stream ID
+    def __init__(self, streams):
+        self.streams = []
+        for stream_id, (path, weight) in enumerate(streams):
+            self.streams.append({'id': stream_id, 'file': open_file(path, 'rb'), 'weight': weight,
+                                 'pass': 0.0, 'seq': 0, 'done': False})
+
+    # Description:
+    # reads the next chunk from the stream with the lowest pass value
+    # Arguments:
+    # self: reference to the instance of the class that the method is being called on
+    # Returns:
+    # Returns the stream ID, stream sequence number and data of the next packet, or None when all streams are done
+    # an empty data chunk marks the end of a stream
+    def next_packet(self):
+        active = [stream for stream in self.streams if not stream['done']]
+        if not active:
+            return None
+
+        stream = min(active, key=lambda s: (s['pass'], s['id']))
+        data = stream['file'].read(1460 - STREAM_HEADER_SIZE)
+        stream_seq = stream['seq']
+        stream['seq'] += 1
+        stream['pass'] += 1 / stream['weight']
+
+        if not data:
+            stream['done'] = True
+            stream['file'].close()
+        return stream['id'], stream_seq, data
+
+
+# Description:
+# builds the file name for a stream: stream 0 uses the file name itself, and stream k is saved as <name>_k<ext>
+# Arguments:
+# file_name: holds the filename given to the server
+# stream_id: the ID of the stream
+# Returns:
+# Returns the file name for the stream
+def stream_file_name(file_name, stream_id):
+    if stream_id == 0:
+        return file_name
+    root, ext = os.path.splitext(file_name)
+    return f"{root}_{stream_id}{ext}"
+
+
+# Description:
+# parses a stream argument of the form FILE or FILE:WEIGHT
+# Arguments:
+# spec: the argument given on the command line
+# Returns:
+# Returns the file path and the weight (default 1)
+def parse_stream(spec):
+    path, sep, weight = spec.rpartition(':')
+    if sep and weight.replace('.', '', 1).isdigit() and float(weight) > 0:
+        return path, float(weight)
+    return spec, 1
+
+
+# Description:
+# Implements a server for a multiplexed connection, where each packet carries a stream ID and a stream sequence
+# number. Every packet is acknowledged individually like in Selective Repeat, but the packets are reassembled per
+# stream, so a lost packet in one stream does not hold back the data of the other streams.
+# Arguments:
+# drtp: an instance of the reliable transport protocol
+# file: the file path where stream 0 will be saved, the other streams are saved next to it
+# test_case: a test case to execute, such as 'skip_ack' to simulate a skipped acknowledgment
+def mux_server(drtp, file, test_case):
+    print("\nMultiplexed server started.")
+
+    streams = {}  # Stream ID to the open file, the expected stream sequence number and the out-of-order buffer
+    skip_ack_counter = 0
+    start_time = time.time()
+
+    try:
+        print("Receiving data...\n")
+        while True:
+            try:
+                drtp.socket.settimeout(0.5)  # Setting a timeout of 500ms
+                data_packet, data_addr = drtp.receive_packet()  # Receiving packet from client
+                seq_num, _, flags, _, data = drtp.parse_packet(data_packet)  # Parsing the received packet
+
+                # Checks for FIN flag and sends FIN-ACK in response
+                if flags & drtp.FIN:
+                    print("\nFIN flag received. Sending FIN-ACK")
+                    ack_packet = drtp.create_packet(0, seq_num, 0x10, 0, b'')
+                    drtp.send_packet(ack_packet, data_addr)
+                    break
+
+                # Resets the connection if the client uses another reliability function
+                if not flags & drtp.STREAM:
+                    reason = "the server expects stream packets, use -r mux"
+                    drtp.reset(reason, data_addr)
+                    raise ConnectionResetError(f"packet {seq_num} has no stream header, {reason}")
+
+                # Skips sending an ACK if the test_case is 'skip_ack' and skip_ack_counter is 0
+                if test_case == 'skip_ack' and skip_ack_counter == 0:
+                    skip_ack_counter += 1
+                    print(f"Skip ACK triggered at sequence number {seq_num} \n")
+                    continue
+
+                ack_packet = drtp.create_packet(0, seq_num, 0x10, 0, b'')
+                drtp.send_packet(ack_packet, data_addr)
+
+                stream_id, stream_seq, payload = drtp.parse_stream_data(data)
+                if stream_id not in streams:
+                    streams[stream_id] = {'file': open_file(stream_file_name(file, stream_id), 'wb'),
+                                          'expected': 0, 'received': {}}
+                stream = streams[stream_id]
+
+                if stream['file'].closed or stream_seq < stream['expected'] or stream_seq in stream['received']:
+                    print(f"Duplicate packet received: {seq_num}")
+                    continue
+                stream['received'][stream_seq] = payload
+
+                # Writes the in-order packets of the stream to its file
+                while stream['expected'] in stream['received']:
+                    payload = stream['received'].pop(stream['expected'])
+                    stream['expected'] += 1
+                    if not payload:
+                        stream['file'].close()
+                        print(f"Stream {stream_id} complete after {time.time() - start_time:.2f} s")
+                        break
+                    stream['file'].write(payload)
+
+            except socket.timeout:
+                print("\nTimeout occurred on the server.")
+                continue
+    finally:
+        for stream in streams.values():
+            stream['file'].close()
+
+
+# Description:
+# Implements a client for a multiplexed connection that sends several files as streams over one connection
+# The streams share one sliding window, which is filled by a StreamScheduler according to the stream weights,
+# and lost packets are resent like in Selective Repeat.
+# Arguments:
+# drtp: an instance of the reliable transport protocol
+# streams: a list of (file path, weight) tuples, one for each stream
+# window_size: the size of the sliding window shared by all streams
+# test_case: a test case to execute, such as 'skip_seq' to simulate skipping a packet sequence number
+def mux_client(drtp, streams, window_size, test_case):
+    print(f"\nMultiplexed client started with {len(streams)} streams.")
+
+    scheduler = StreamScheduler(streams)
+    base = 0
+    next_seq_num = 0
+    packets_in_window = {}
+    received = {}
+    all_scheduled = False
+
+    # Variables for calculating average RTT, from the time each packet was first sent to its ACK
+    send_times = {}
+    rtt_sum = 0
+    packet_count = 0
+
+    # Variable for skip_seq test case
+    skip_seq = 5
+
+    drtp.socket.settimeout(0.5)  # Initial timeout value to 500ms
+
+    print("Transmitting data...")
+    while True:
+        # Fills the shared window with packets from the streams chosen by the scheduler
+        while not all_scheduled and next_seq_num < base + window_size:
+            next_packet = scheduler.next_packet()
+            if next_packet is None:
+                all_scheduled = True
+                break
+
+            stream_id, stream_seq, data = next_packet
+            packet = drtp.create_stream_packet(next_seq_num, 0, 0, 0, stream_id, stream_seq, data)
+
+            # Skipping a sequence number to simulate loss
+            if test_case == "skip_seq" and next_seq_num == skip_seq:
+                print(f"\nSkipping packet with sequence number: {next_seq_num}")
+            else:
+                drtp.send_packet(packet, (drtp.ip, drtp.port))
+                send_times[next_seq_num] = time.time()
+            packets_in_window[next_seq_num] = packet
+
+            next_seq_num += 1
+
+            # Sending an old sequence number to test the handling of duplicate packets
+            if test_case == "duplicate" and next_seq_num == 6:
+                print(f"Sending duplicate packet with sequence number: {next_seq_num - 1}")
+                drtp.send_packet(packet, (drtp.ip, drtp.port))
+                send_times.pop(next_seq_num - 1, None)  # The ACK could be for either copy
+
+        if not packets_in_window:
+            break
+
+        # Receives ACK packets and updates the base sequence number and window accordingly
+        try:
+            ack_packet, ack_addr = drtp.receive_packet()  # Receiving ACK from server
+            recv_time = time.time()  # Time after receiving ACK packet
+            _, ack_num, flags, _, _ = drtp.parse_packet(ack_packet)  # Parsing the packet received
+
+            # Cheking if the received packet is an ACK for a packet in the window, duplicate ACKs are ignored
+            if flags & 0x10 and ack_num in packets_in_window:
+                packets_in_window.pop(ack_num)  # Removing acknowledged packet from window
+                received[ack_num] = True
+                while base in received:  # Move the base if the packet is acknowledged
+                    received.pop(base)
+                    base += 1
+
+                # Calculates the RTT, only for packets that were sent once
+                send_time = send_times.pop(ack_num, None)
+                if send_time is not None:
+                    rtt_sum += recv_time - send_time
+                    packet_count += 1
+
+                    # Calculates the average RTT and set the timeout to 4RTTs
+                    avg_rtt = rtt_sum / packet_count
+                    drtp.socket.settimeout(max(4 * avg_rtt, MIN_TIMEOUT))
+
+        except socket.timeout:
+            print("\nTimeout occurred.")
+            for seq_num in sorted(packets_in_window.keys()):
+                drtp.send_packet(packets_in_window[seq_num], (drtp.ip, drtp.port))
+                send_times.pop(seq_num, None)  # A resent packet gives no RTT sample
+                print(f"Resending packet with sequence number: {seq_num}")
+
+    # Sends a packet with the FIN flag set after the data of all streams has been sent
+    print("\nSending FIN packet.")
+    fin_packet = drtp.create_packet(next_seq_num, 0, drtp.FIN, 0, b'')
+    drtp.send_packet(fin_packet, (drtp.ip, drtp.port))
+
+
 if __name__ == '__main__':
     # Parsing all the available flags to an argument parser
     parser = argparse.ArgumentParser(description='Simple file transfer application using DRTP protocol')
@@ -557,6 +1467,12 @@ if __name__ == '__main__':
                         help='Reliability function to use (default: stop_and_wait)')
     parser.add_argument('-w', '--window_size', default=5, type=int, help="Size of the sliding window")
     parser.add_argument('-t', '--test_case', type=str, default=None, help='Test case to run (e.g., skip_ack)')
+    parser.add_argument('-d', '--delta', action='store_true',
+                        help='Only send the parts of the file that the server does not already have')
+    parser.add_argument('-m', '--stream', action='append', default=[], metavar='FILE[:WEIGHT]',
+                        help='Extra file to send as a stream next to -f with the mux function (can be repeated)')
+    parser.add_argument('-n', '--workers', default=1, type=int,
+                        help='Number of server worker processes sharing the port (default: 1)')
 
     args = parser.parse_args()
 
@@ -565,9 +1481,24 @@ if __name__ == '__main__':
         print('Port out of range: port must be between 1024 and 65536!')
         sys.exit(1)
 
+    # Error message for invalid number of workers
+    if args.workers < 1:
+        print('Invalid number of workers: must be at least 1!')
+        sys.exit(1)
+
     # Error message for invalid reliability function
-    if args.reliability_func not in ['stop-and-wait', 'gbn', 'sr']:
-        print('Invalid reliability function: choose between stop-and-wait, gbn or sr!')
+    if args.reliability_func not in ['stop-and-wait', 'gbn', 'sr', 'auto', 'mux']:
+        print('Invalid reliability function: choose between stop-and-wait, gbn, sr, auto or mux!')
+        sys.exit(1)
+
+    # Error message for streams without the mux function
+    if args.stream and args.reliability_func != 'mux':
+        print('Streams can only be sent with the mux reliability function!')
+        sys.exit(1)
+
+    # Error message for delta transfer with the mux function
+    if args.delta and args.reliability_func == 'mux':
+        print('Delta transfer can not be combined with the mux reliability function!')
         sys.exit(1)
 
     # Error message for invalid test case
@@ -577,9 +1508,11 @@ if __name__ == '__main__':
 
     # Runs eiter server or client, otherwise an error message is shown
     if args.server:
-        server(args.ip, args.port, args.file_name, args.reliability_func, args.test_case)
+        server(args.ip, args.port, args.file_name, args.reliability_func, args.test_case, args.workers, args.delta,
+               args.window_size)
     elif args.client:
-        client(args.ip, args.port, args.file_name, args.reliability_func, args.window_size, args.test_case)
+        client(args.ip, args.port, args.file_name, args.reliability_func, args.window_size, args.test_case,
+               args.delta, [parse_stream(spec) for spec in args.stream])
     else:
         print('Error: must be in either client(-c) or server(-s) mode!')
         sys.exit(1)
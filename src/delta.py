@@ -0,0 +1,254 @@
+import hashlib
+import mmap
+import os
+from itertools import accumulate
+from struct import pack, unpack, calcsize
+
+BLOCK_SIZE = 1460				# Same size as the data chunks sent by the reliability functions
+SIGNATURE_FORMAT = "!I16s"		# Weak rolling checksum and strong hash of a block
+COPY = b'C'						# Delta instruction: copy a range of blocks from the old file
+LITERAL = b'L'					# Delta instruction: insert literal data
+IO_CHUNK = 1 << 20				# Largest piece of a file that is read into memory at once
+
+
+# Description:
+# computes the rsync weak checksum of a block in bulk, using sum and accumulate instead of a loop over the bytes
+# Arguments:
+# block: the bytes of the block
+# Returns:
+# Returns the two 16 bit halves a and b of the checksum
+def weak_checksum(block):
+    a = sum(block) & 0xffff
+    b = sum(accumulate(block)) & 0xffff		# Sum of the prefix sums equals the sum of (L - i) * x_i
+    return a, b
+
+
+# Description:
+# computes the strong hash of a block, used to confirm a match of the weak checksum
+# Arguments:
+# block: the bytes of the block
+# Returns:
+# Returns a 16 byte digest
+def strong_hash(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+# Description:
+# opens the file the receiver already has, which is then used both for the signatures and for applying the
+# delta, so that the delta is applied to the same data even if the file is replaced in between
+# Arguments:
+# basis_path: the file the receiver already has
+# Returns:
+# Returns the open file, or None if there is no such file
+def open_basis(basis_path):
+    try:
+        return open(basis_path, 'rb')
+    except FileNotFoundError:
+        return None
+
+
+# Description:
+# computes the signatures of every full block of the existing file and writes them to a signature file
+# a missing file gives an empty signature list, so the whole file will be sent as literal data
+# Arguments:
+# basis: the file the receiver already has, opened with open_basis
+# sig_path: the file to write the signatures to
+# block_size: the size of each block
+# Returns:
+# Returns the number of blocks in the signature file
+def write_signatures(basis, sig_path, block_size=BLOCK_SIZE):
+    blocks = 0
+    with open(sig_path, 'wb') as out:
+        out.write(pack("!I", block_size))
+        if basis is not None:
+            basis.seek(0)
+            while True:
+                block = basis.read(block_size)		# Reads one block at a time, so the file is never held in memory
+                if len(block) < block_size:
+                    break
+                a, b = weak_checksum(block)
+                out.write(pack(SIGNATURE_FORMAT, a | (b << 16), strong_hash(block)))
+                blocks += 1
+    return blocks
+
+
+# Description:
+# reads a signature file into a lookup table
+# Arguments:
+# sig_path: the signature file written by write_signatures
+# Returns:
+# Returns the block size and a dictionary mapping each weak checksum to a list of (block index, strong hash)
+def read_signatures(sig_path):
+    with open(sig_path, 'rb') as f:
+        content = f.read()
+
+    if len(content) < 4:
+        return BLOCK_SIZE, {}
+
+    block_size, = unpack("!I", content[:4])
+    size = calcsize(SIGNATURE_FORMAT)
+    table = {}
+    for index, offset in enumerate(range(4, len(content) - size + 1, size)):
+        weak, strong = unpack(SIGNATURE_FORMAT, content[offset:offset + size])
+        table.setdefault(weak, []).append((index, strong))
+    return block_size, table
+
+
+# Description:
+# finds the blocks of the new file that the receiver already has, using a rolling weak checksum,
+# and writes the delta as copy instructions for matching blocks and literal data for everything else
+# the file is memory mapped, so only the pages being scanned are held in memory. The checksum is rolled in
+# pure Python, one byte at a time where nothing matches, which costs about 0.4 s per MB of changed data
+# Arguments:
+# src_path: the new file to send
+# signatures: the block size and lookup table returned by read_signatures
+# delta_path: the file to write the delta to
+# Returns:
+# Returns the number of literal bytes and the number of copied blocks in the delta
+def write_delta(src_path, signatures, delta_path):
+    block_size, table = signatures
+    with open(src_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            data = b''												# An empty file can not be memory mapped
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return scan_file(data, block_size, table, delta_path)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+# Description:
+# scans the data of the new file for blocks in the lookup table and writes the delta, see write_delta
+# Arguments:
+# data: the bytes or memory map of the new file
+# block_size: the block size used for the signatures
+# table: the lookup table returned by read_signatures
+# delta_path: the file to write the delta to
+# Returns:
+# Returns the number of literal bytes and the number of copied blocks in the delta
+def scan_file(data, block_size, table, delta_path):
+    literal_bytes = 0
+    copied_blocks = 0
+    copy_start = None		# First block of the pending copy range
+    copy_count = 0
+
+    with open(delta_path, 'wb') as out:
+
+        # Writes the pending range of copied blocks as one instruction
+        def flush_copy():
+            nonlocal copy_start, copy_count
+            if copy_count:
+                out.write(COPY + pack("!II", copy_start, copy_count))
+            copy_start, copy_count = None, 0
+
+        # Writes the literal data between two matches, in pieces so that a long run is never held in memory
+        def flush_literal(start, end):
+            nonlocal literal_bytes
+            if end > start:
+                flush_copy()
+                out.write(LITERAL + pack("!I", end - start))
+                for pos in range(start, end, IO_CHUNK):
+                    out.write(data[pos:min(pos + IO_CHUNK, end)])
+                literal_bytes += end - start
+
+        n = len(data)
+        last = n - block_size		# Last offset where a full block starts
+        i = 0
+        literal_start = 0
+        if table and last >= 0:
+            a, b = weak_checksum(data[:block_size])
+
+        while table and i <= last:
+            # Rolls the checksum forward until its weak checksum is in the table, in a tight loop over a
+            # window of at most IO_CHUNK bytes copied from the file, since indexing bytes is faster than a memory map
+            weak = a | (b << 16)
+            while weak not in table and i < last:
+                steps = min(last - i, IO_CHUNK)
+                window = data[i:i + steps + block_size]
+                for j in range(steps):
+                    if weak in table:
+                        break
+                    old = window[j]
+                    a = (a - old + window[j + block_size]) & 0xffff
+                    b = (b - block_size * old + a) & 0xffff
+                    weak = a | (b << 16)
+                else:
+                    j = steps
+                i += j
+
+            match = None
+            candidates = table.get(weak)
+            if candidates:
+                digest = strong_hash(data[i:i + block_size])		# Only hashed when the weak checksum matches
+                for index, strong in candidates:
+                    if strong == digest:
+                        match = index
+                        break
+
+            if match is not None:
+                flush_literal(literal_start, i)
+
+                # Extends the pending copy range if the block follows the previous one
+                if copy_count and match == copy_start + copy_count:
+                    copy_count += 1
+                else:
+                    flush_copy()
+                    copy_start, copy_count = match, 1
+                copied_blocks += 1
+
+                i += block_size
+                literal_start = i
+                if i <= last:
+                    a, b = weak_checksum(data[i:i + block_size])
+                continue
+
+            # Rolls the checksum one byte forward past a weak match that was not confirmed by the strong hash
+            if i < last:
+                old = data[i]
+                a = (a - old + data[i + block_size]) & 0xffff
+                b = (b - block_size * old + a) & 0xffff
+            i += 1
+
+        flush_literal(literal_start, n)
+        flush_copy()
+
+    return literal_bytes, copied_blocks
+
+
+# Description:
+# rebuilds the new file from the existing file and the received delta
+# Arguments:
+# basis: the file the receiver already has, the same open file that the signatures were computed from
+# delta_path: the delta written by write_delta
+# out_path: the file to write the rebuilt file to
+# block_size: the block size used for the signatures
+def apply_delta(basis, delta_path, out_path, block_size=BLOCK_SIZE):
+    with open(delta_path, 'rb') as delta, open(out_path, 'wb') as out:
+        while True:
+            kind = delta.read(1)
+            if not kind:
+                break
+            if kind == COPY:
+                start, count = unpack("!II", delta.read(8))
+                if basis is None:
+                    raise ValueError("Delta copies blocks, but there is no existing file")
+                basis.seek(start * block_size)
+                copy_data(basis, out, count * block_size)
+            elif kind == LITERAL:
+                length, = unpack("!I", delta.read(4))
+                copy_data(delta, out, length)
+            else:
+                raise ValueError(f"Invalid delta instruction: {kind}")
+
+
+# Helper function that copies length bytes from one open file to another in pieces of at most IO_CHUNK bytes
+def copy_data(src, out, length):
+    while length > 0:
+        data = src.read(min(length, IO_CHUNK))
+        if not data:
+            raise ValueError("Delta refers to data past the end of the file")
+        out.write(data)
+        length -= len(data)
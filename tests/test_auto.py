@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from application import GBN_LOSS_BUDGET, HIGH_LOSS, HIGH_RTT, SR_LOSS, choose_mode
+
+LOW_RTT = 0.001
+
+
+# Checks that a clean connection uses Go-Back-N with the full window
+def test_clean_connection_uses_gbn():
+    assert choose_mode("gbn", 0, LOW_RTT, 0, 32) == ("gbn", 32)
+    assert choose_mode("sr", 0, LOW_RTT, 0, 32) == ("gbn", 32)
+    assert choose_mode("stop-and-wait", 0, LOW_RTT, 0, 32) == ("gbn", 32)
+
+
+# Checks that SR is entered at SR_LOSS and only left below half of it
+def test_sr_thresholds():
+    assert choose_mode("gbn", SR_LOSS * 0.9, LOW_RTT, 0, 8)[0] == "gbn"
+    assert choose_mode("gbn", SR_LOSS, LOW_RTT, 0, 8) == ("sr", 8)
+    assert choose_mode("sr", SR_LOSS * 0.6, LOW_RTT, 0, 8) == ("sr", 8)
+    assert choose_mode("sr", SR_LOSS * 0.4, LOW_RTT, 0, 8)[0] == "gbn"
+
+
+# Checks that a high RTT halves the loss rate where SR is preferred
+def test_high_rtt_prefers_sr_sooner():
+    loss = SR_LOSS * 0.6
+    assert choose_mode("gbn", loss, LOW_RTT, 0, 8)[0] == "gbn"
+    assert choose_mode("gbn", loss, HIGH_RTT, 0, 8)[0] == "sr"
+
+
+# Checks that any reordering selects SR, and that SR is left once there is no reordering and little loss
+def test_reordering_selects_sr():
+    assert choose_mode("gbn", 0, LOW_RTT, 0.01, 16) == ("sr", 16)
+    assert choose_mode("sr", 0, LOW_RTT, 0.01, 16) == ("sr", 16)
+    assert choose_mode("sr", 0, LOW_RTT, 0, 16)[0] == "gbn"
+
+
+# Checks that stop-and-wait is entered at HIGH_LOSS and only left below half of it
+@pytest.mark.parametrize("mode", ["gbn", "sr"])
+def test_stop_and_wait_thresholds(mode):
+    assert choose_mode(mode, HIGH_LOSS * 0.9, LOW_RTT, 0, 8)[0] == "sr"
+    assert choose_mode(mode, HIGH_LOSS, LOW_RTT, 0, 8) == ("stop-and-wait", 1)
+    assert choose_mode("stop-and-wait", HIGH_LOSS * 0.6, LOW_RTT, 0, 8) == ("stop-and-wait", 1)
+    assert choose_mode("stop-and-wait", HIGH_LOSS * 0.4, LOW_RTT, 0, 8) == ("sr", 8)
+
+
+# Checks that the Go-Back-N window shrinks as the loss rate grows, and never exceeds the window the user allows
+@pytest.mark.parametrize("loss, window_size, expected", [
+    (0, 64, 64),
+    (0.001, 64, 64),
+    (0.01, 64, int(GBN_LOSS_BUDGET / 0.01)),
+    (0.015, 64, int(GBN_LOSS_BUDGET / 0.015)),
+    (0.01, 16, 16),
+    (0.015, 5, 5),
+])
+def test_gbn_window_sizing(loss, window_size, expected):
+    assert choose_mode("gbn", loss, LOW_RTT, 0, window_size) == ("gbn", expected)
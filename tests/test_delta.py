@@ -0,0 +1,132 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from delta import BLOCK_SIZE, apply_delta, open_basis, read_signatures, weak_checksum, write_delta, write_signatures
+
+
+# Helper function that sends new_data as a delta against basis_data (None for a missing file) and returns
+# the rebuilt file with the number of literal bytes and copied blocks in the delta
+def round_trip(tmp_path, basis_data, new_data, block_size=BLOCK_SIZE):
+    basis_path = tmp_path / "basis.bin"
+    if basis_data is not None:
+        basis_path.write_bytes(basis_data)
+    (tmp_path / "new.bin").write_bytes(new_data)
+
+    basis = open_basis(basis_path)
+    try:
+        write_signatures(basis, tmp_path / "sig.bin", block_size)
+        literal_bytes, copied_blocks = write_delta(tmp_path / "new.bin", read_signatures(tmp_path / "sig.bin"),
+                                                   tmp_path / "delta.bin")
+        apply_delta(basis, tmp_path / "delta.bin", tmp_path / "out.bin", block_size)
+    finally:
+        if basis is not None:
+            basis.close()
+    return (tmp_path / "out.bin").read_bytes(), literal_bytes, copied_blocks
+
+
+# Checks that the weak checksum rolled one byte at a time matches the checksum computed from scratch
+def test_rolling_checksum_matches_full_checksum():
+    data = random.Random(1).randbytes(200)
+    block_size = 16
+    a, b = weak_checksum(data[:block_size])
+    for i in range(len(data) - block_size):
+        old = data[i]
+        a = (a - old + data[i + block_size]) & 0xffff
+        b = (b - block_size * old + a) & 0xffff
+        assert (a, b) == weak_checksum(data[i + 1:i + 1 + block_size])
+
+
+# Checks the rebuilt file for changes at the start, in the middle and at the end of the file
+@pytest.mark.parametrize("change", ["same", "insert", "delete", "modify", "append", "truncate", "prepend"])
+def test_round_trip_changes(tmp_path, change):
+    basis = random.Random(2).randbytes(20 * BLOCK_SIZE + 123)
+    new = {
+        "same": basis,
+        "insert": basis[:5000] + b'inserted' * 40 + basis[5000:],
+        "delete": basis[:3000] + basis[3700:],
+        "modify": basis[:8000] + bytes(x ^ 0xff for x in basis[8000:8100]) + basis[8100:],
+        "append": basis + b'appended',
+        "truncate": basis[:10 * BLOCK_SIZE + 7],
+        "prepend": b'x' + basis,
+    }[change]
+
+    rebuilt, literal_bytes, copied_blocks = round_trip(tmp_path, basis, new)
+    assert rebuilt == new
+    assert copied_blocks >= 10  # Most of the file is copied, not sent again
+    assert literal_bytes < len(new) // 2
+
+
+# Checks the edge cases where the basis or the new file is empty, missing or shorter than one block
+@pytest.mark.parametrize("basis, new", [
+    (None, b'new file' * 1000),
+    (b'', b'new file' * 1000),
+    (b'old file' * 1000, b''),
+    (b'', b''),
+    (b'short', b'short'),
+    (b'x' * (BLOCK_SIZE - 1), b'x' * (BLOCK_SIZE - 1) + b'y'),
+    (b'old file' * 1000, b'short'),
+])
+def test_round_trip_edge_cases(tmp_path, basis, new):
+    rebuilt, literal_bytes, copied_blocks = round_trip(tmp_path, basis, new)
+    assert rebuilt == new
+    if basis is None or len(basis) < BLOCK_SIZE:
+        assert copied_blocks == 0 and literal_bytes == len(new)
+
+
+# Checks files made of repeated blocks, where the weak checksum of many blocks is the same
+def test_round_trip_repeated_blocks(tmp_path):
+    block = random.Random(3).randbytes(64)
+    basis = block * 50
+    new = block * 20 + b'changed' + block * 40 + b'z' * 10
+
+    rebuilt, literal_bytes, copied_blocks = round_trip(tmp_path, basis, new, block_size=64)
+    assert rebuilt == new
+    assert copied_blocks == 60
+    assert literal_bytes == len(b'changed') + 10
+
+
+# Sends random edits with small blocks, which exercises the rolling checksum at every offset
+def test_round_trip_random_edits(tmp_path):
+    rng = random.Random(4)
+    for _ in range(50):
+        basis = rng.randbytes(rng.randrange(0, 2000))
+        new = bytearray(basis)
+        for _ in range(rng.randrange(0, 5)):
+            pos = rng.randrange(0, len(new) + 1)
+            kind = rng.choice(["insert", "delete", "modify"])
+            if kind == "insert":
+                new[pos:pos] = rng.randbytes(rng.randrange(1, 50))
+            elif kind == "delete":
+                del new[pos:pos + rng.randrange(1, 50)]
+            else:
+                new[pos:pos + 10] = rng.randbytes(10)
+
+        rebuilt, _, _ = round_trip(tmp_path, basis, bytes(new), block_size=rng.choice([1, 7, 32, 100]))
+        assert rebuilt == bytes(new)
+
+
+# Checks that the delta is applied to the basis the signatures were computed from, even if the file is
+# replaced by another transfer in between
+def test_apply_delta_uses_the_opened_basis(tmp_path):
+    basis_path = tmp_path / "basis.bin"
+    old = random.Random(5).randbytes(10 * BLOCK_SIZE)
+    new = old[:4 * BLOCK_SIZE] + b'changed' + old[4 * BLOCK_SIZE:]
+    basis_path.write_bytes(old)
+    (tmp_path / "new.bin").write_bytes(new)
+
+    with open_basis(basis_path) as basis:
+        write_signatures(basis, tmp_path / "sig.bin")
+        write_delta(tmp_path / "new.bin", read_signatures(tmp_path / "sig.bin"), tmp_path / "delta.bin")
+
+        # Another transfer replaces the file before the delta is applied
+        (tmp_path / "other.bin").write_bytes(random.Random(6).randbytes(10 * BLOCK_SIZE))
+        os.replace(tmp_path / "other.bin", basis_path)
+
+        apply_delta(basis, tmp_path / "delta.bin", tmp_path / "out.bin")
+
+    assert (tmp_path / "out.bin").read_bytes() == new
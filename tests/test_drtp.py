@@ -0,0 +1,135 @@
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import DRTP as drtp_module
+from DRTP import DRTP, TOKEN_LIFETIME, load_secret
+
+CLIENT = ('10.0.0.1', 40000)
+
+
+# Checks that a token is accepted from the IP address it was created for, from any port
+def test_token_is_valid_for_its_ip():
+    server = DRTP('127.0.0.1', 8080, None)
+    token = server.create_token(CLIENT)
+    assert len(token) == 20
+    assert server.valid_token(token, CLIENT)
+    assert server.valid_token(token, (CLIENT[0], 50000))
+
+
+# Checks that a token is rejected from another IP address, by a server with another key, and when changed
+def test_token_is_rejected_for_wrong_ip_key_or_content():
+    server = DRTP('127.0.0.1', 8080, None)
+    token = server.create_token(CLIENT)
+    assert not server.valid_token(token, ('10.0.0.2', CLIENT[1]))
+
+    other = DRTP('127.0.0.1', 8080, None)
+    assert not other.valid_token(token, CLIENT)
+
+    tampered = token[:-1] + bytes([token[-1] ^ 1])
+    assert not server.valid_token(tampered, CLIENT)
+    later_expiry = (int.from_bytes(token[:4], 'big') + 3600).to_bytes(4, 'big') + token[4:]
+    assert not server.valid_token(later_expiry, CLIENT)
+
+
+# Checks that tokens of the wrong length are rejected
+@pytest.mark.parametrize("length", [0, 4, 19, 21, 40])
+def test_token_with_wrong_length_is_rejected(length):
+    server = DRTP('127.0.0.1', 8080, None)
+    token = (server.create_token(CLIENT) * 2)[:length]
+    assert not server.valid_token(token, CLIENT)
+
+
+# Checks that a token expires after TOKEN_LIFETIME seconds
+def test_token_expires(monkeypatch):
+    server = DRTP('127.0.0.1', 8080, None)
+    token = server.create_token(CLIENT)
+    now = time.time()
+    monkeypatch.setattr(drtp_module.time, "time", lambda: now + TOKEN_LIFETIME - 5)
+    assert server.valid_token(token, CLIENT)
+    monkeypatch.setattr(drtp_module.time, "time", lambda: now + TOKEN_LIFETIME + 5)
+    assert not server.valid_token(token, CLIENT)
+
+
+# Checks that the token cache is only readable by the user, and that it is replaced without leaving other files
+def test_token_cache_is_private(tmp_path, monkeypatch):
+    cache = tmp_path / ".drtp_tokens"
+    monkeypatch.setattr(drtp_module, "TOKEN_CACHE", str(cache))
+    cache.write_text("{}")
+    cache.chmod(0o644)  # A cache written by an earlier version
+
+    client = DRTP('127.0.0.1', 8080, None)
+    client.save_token(b'token 1')
+    DRTP('127.0.0.2', 8080, None).save_token(b'token 2')
+
+    assert stat.S_IMODE(cache.stat().st_mode) == 0o600
+    assert client.load_token() == b'token 1'
+    assert DRTP('127.0.0.2', 8080, None).load_token() == b'token 2'
+    assert [path.name for path in tmp_path.iterdir()] == [".drtp_tokens"]
+
+
+# Checks that the server key is created once, only readable by the user, and kept for later runs
+def test_secret_is_kept(tmp_path, monkeypatch):
+    secret_file = tmp_path / ".drtp_secret"
+    monkeypatch.setattr(drtp_module, "SECRET_FILE", str(secret_file))
+
+    secret = load_secret()
+    assert len(secret) == 16
+    assert stat.S_IMODE(secret_file.stat().st_mode) == 0o600
+    assert load_secret() == secret
+
+
+# Helper function that runs syn_server on a new server socket in a thread
+def start_server():
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server_socket.bind(('127.0.0.1', 0))
+    server = DRTP('127.0.0.1', server_socket.getsockname()[1], server_socket)
+    thread = threading.Thread(target=server.syn_server, daemon=True)
+    thread.start()
+    return server, thread
+
+
+# Checks that a client with a valid token is accepted at once
+def test_valid_token_skips_the_handshake():
+    server, thread = start_server()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.bind(('127.0.0.1', 0))
+        token = server.create_token(client.getsockname())
+        client.sendto(server.create_packet(0, 0, server.SYN | server.RESUME, 0, token), server.socket.getsockname())
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+        assert server.peer == client.getsockname()
+    server.close()
+
+
+# Checks that a client with an invalid token gets a SYN-ACK, and that its data is dropped until it has
+# answered the SYN-ACK with an ACK
+def test_rejected_token_drops_data_until_the_handshake_is_complete():
+    server, thread = start_server()
+    server_addr = server.socket.getsockname()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.bind(('127.0.0.1', 0))
+        client.settimeout(2)
+        client.sendto(server.create_packet(0, 0, server.SYN | server.RESUME, 0, b'x' * 20), server_addr)
+        syn_ack, _ = client.recvfrom(1472)
+        seq_num, ack_num, flags, window, token = server.parse_packet(syn_ack)
+        assert flags == server.SYN | server.ACK and len(token) == 20
+
+        # Data sent ahead of the handshake, with the ACK flag piggybacked, is dropped
+        client.sendto(server.create_packet(0, 0, server.ACK, 0, b'early data'), server_addr)
+        time.sleep(0.3)
+        assert thread.is_alive()
+
+        client.sendto(server.create_packet(seq_num + 1, ack_num, server.ACK, window, b''), server_addr)
+        thread.join(timeout=2)
+        assert not thread.is_alive()
+        assert server.peer == client.getsockname()
+        assert server.pending == []
+    server.close()
@@ -0,0 +1,239 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from struct import pack
+
+import pytest
+
+APPLICATION = os.path.join(os.path.dirname(__file__), "..", "src", "application.py")
+
+
+# Helper function that finds a free UDP port for the server
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# Helper function that starts the application with the given arguments in a directory
+def start(args, cwd):
+    env = dict(os.environ, HOME=str(cwd))  # No resumption tokens from earlier runs
+    return subprocess.Popen([sys.executable, os.path.abspath(APPLICATION)] + args, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# Sends a file from several clients at once to a server with two workers, and checks that every
+# client finishes and that every received file matches the sent file
+def test_concurrent_clients_with_workers(tmp_path):
+    data = os.urandom(300000)
+    (tmp_path / "send.bin").write_bytes(data)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    clients = []
+    try:
+        time.sleep(1)  # Giving the workers time to bind the port
+        for i in range(8):
+            client_dir = tmp_path / f"client{i}"
+            client_dir.mkdir()
+            clients.append(start(['-c', '-p', str(port), '-r', 'gbn', '-f', str(tmp_path / "send.bin")], client_dir))
+
+        for client in clients:
+            assert client.wait(timeout=30) == 0
+
+        time.sleep(0.5)  # Giving the workers time to finish the last files
+        received = sorted(tmp_path.glob("received_*.bin"))
+        assert len(received) == 8
+        for path in received:
+            assert path.read_bytes() == data
+    finally:
+        for client in clients:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+
+
+# Connects to the server, sends one data packet and disappears without sending a FIN
+def dead_client(port, source='127.0.0.1'):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind((source, 0))
+        s.settimeout(1)
+        for _ in range(30):  # Resends the SYN while the worker is busy with an earlier client
+            s.sendto(pack("!IIHH", 0, 0, 1 << 1, 64), ('127.0.0.1', port))  # SYN
+            try:
+                s.recvfrom(1472)  # SYN-ACK
+                break
+            except socket.timeout:
+                continue
+        s.sendto(pack("!IIHH", 1, 1, 1 << 0, 64), ('127.0.0.1', port))  # ACK
+        s.sendto(pack("!IIHH", 0, 0, 0, 0) + b'x' * 100, ('127.0.0.1', port))
+
+
+# Checks that clients that disappear in the middle of a transfer do not block the workers for good
+def test_dead_clients_do_not_block_workers(tmp_path):
+    data = os.urandom(100000)
+    (tmp_path / "send.bin").write_bytes(data)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    clients = []
+    try:
+        time.sleep(1)  # Giving the workers time to bind the port
+        for _ in range(2):
+            dead_client(port)
+
+        for i in range(4):
+            client_dir = tmp_path / f"client{i}"
+            client_dir.mkdir()
+            clients.append(start(['-c', '-p', str(port), '-r', 'gbn', '-f', str(tmp_path / "send.bin")], client_dir))
+
+        for client in clients:
+            assert client.wait(timeout=60) == 0
+    finally:
+        for client in clients:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+
+
+# Connects a delta client while the workers are sending the signatures to clients that went silent,
+# and checks that the delta client is served once a worker gives up its silent client
+def test_delta_client_during_signature_phase(tmp_path):
+    data = os.urandom(100000)
+    (tmp_path / "send.bin").write_bytes(data)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-d', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    client = None
+    try:
+        time.sleep(1)  # Giving the workers time to bind the port
+        for _ in range(3):  # Most likely keeps both workers busy, from another address so that the file is not locked
+            dead_client(port, source='127.0.0.2')
+
+        client_dir = tmp_path / "client"
+        client_dir.mkdir()
+        client = start(['-c', '-p', str(port), '-d', '-r', 'gbn', '-f', str(tmp_path / "send.bin")], client_dir)
+        assert client.wait(timeout=60) == 0
+
+        time.sleep(0.5)  # Giving the worker time to rebuild the file
+        assert (tmp_path / "received_127.0.0.1.bin").read_bytes() == data
+    finally:
+        if client:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+
+
+# Helper function that finds the worker processes of a server by scanning /proc for its children
+def worker_pids(server_pid):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rindex(')') + 2:].split()  # The fields after the process name
+        if int(fields[1]) == server_pid and fields[0] != 'Z':
+            pids.append(int(entry))
+    return pids
+
+
+# Sends datagrams that are too short to hold a header, and checks that the workers still serve clients
+def test_malformed_packets_do_not_kill_workers(tmp_path):
+    data = os.urandom(100000)
+    (tmp_path / "send.bin").write_bytes(data)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    clients = []
+    try:
+        time.sleep(1)  # Giving the workers time to bind the port
+        for _ in range(20):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.sendto(b'xx', ('127.0.0.1', port))
+
+        for i in range(4):
+            client_dir = tmp_path / f"client{i}"
+            client_dir.mkdir()
+            clients.append(start(['-c', '-p', str(port), '-r', 'gbn', '-f', str(tmp_path / "send.bin")], client_dir))
+
+        for client in clients:
+            assert client.wait(timeout=30) == 0
+    finally:
+        for client in clients:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+
+
+# Kills the workers and checks that the supervisor restarts them
+@pytest.mark.skipif(not os.path.isdir('/proc'), reason="finds the workers through /proc")
+def test_dead_workers_are_restarted(tmp_path):
+    data = os.urandom(100000)
+    (tmp_path / "send.bin").write_bytes(data)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    client = None
+    try:
+        time.sleep(2)  # Giving the workers time to bind the port and run for a while
+        workers = worker_pids(server.pid)
+        assert len(workers) == 2
+        for pid in workers:
+            os.kill(pid, signal.SIGKILL)
+
+        client = start(['-c', '-p', str(port), '-r', 'gbn', '-f', str(tmp_path / "send.bin")], tmp_path)
+        assert client.wait(timeout=30) == 0
+        assert server.poll() is None
+    finally:
+        if client:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+
+
+# Checks that the server exits with an error when the port can not be bound
+def test_bind_failure_stops_the_server(tmp_path):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(('', 0))
+        server = start(['-s', '-p', str(s.getsockname()[1]), '-n', '2', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+        try:
+            assert server.wait(timeout=10) == 1
+        finally:
+            server.kill()
+
+
+# Sends two versions of a file at once from one host in delta mode, and checks that the file on the server ends up
+# as one of the versions: each transfer is either applied to its own copy of the file or reset
+def test_concurrent_delta_clients_from_one_host(tmp_path):
+    basis = os.urandom(600000)
+    versions = [b'A' * 5000 + basis[5000:], basis[:300000] + b'B' * 5000 + basis[305000:]]
+    (tmp_path / "received_127.0.0.1.bin").write_bytes(basis)
+    port = free_port()
+
+    server = start(['-s', '-p', str(port), '-n', '2', '-d', '-r', 'gbn', '-f', 'received.bin'], tmp_path)
+    clients = []
+    try:
+        time.sleep(1)  # Giving the workers time to bind the port
+        for i, version in enumerate(versions):
+            client_dir = tmp_path / f"client{i}"
+            client_dir.mkdir()
+            (client_dir / "send.bin").write_bytes(version)
+            clients.append(start(['-c', '-p', str(port), '-d', '-r', 'gbn', '-f', 'send.bin'], client_dir))
+
+        codes = [client.wait(timeout=60) for client in clients]
+        assert 0 in codes and set(codes) <= {0, 1}
+
+        time.sleep(0.5)  # Giving the worker time to rebuild the file
+        assert (tmp_path / "received_127.0.0.1.bin").read_bytes() in versions
+    finally:
+        for client in clients:
+            client.kill()
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)